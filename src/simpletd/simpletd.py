@@ -4,19 +4,101 @@
 #
 # Distributed under the Boost Software License, Version 1.0. (See accompanying
 # file LICENSE_1_0.txt or copy at http://www.boost.org/LICENSE_1_0.txt)
-import binascii
+from concurrent.futures import Future, TimeoutError as _FutureTimeoutError
 from ctypes import CDLL, CFUNCTYPE, c_char_p, c_double, c_int
 from ctypes.util import find_library
-import json
-from logging import getLogger
+from logging import DEBUG, getLogger
 import os
+import queue
+import re
 import sys
-import time
+import threading
 from typing import Any, Dict, Optional
 
+# orjson serializes straight to bytes and parses bytes directly, skipping the
+# UTF-8 round trip stdlib json needs on every TDLib request/update. Set
+# SIMPLETD_USE_STDLIB_JSON to force stdlib behavior (e.g. for NaN support).
+if os.environ.get("SIMPLETD_USE_STDLIB_JSON"):
+    orjson = None
+else:
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+
+    def _dumps_pretty(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+else:
+    import json
+
+    def _dumps(obj: Any) -> bytes:
+        # Compact separators to match orjson's wire format; the default
+        # ", "/": " padding is dead weight across the FFI.
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    _loads = json.loads
+
+    def _dumps_pretty(obj: Any) -> str:
+        return json.dumps(obj, indent=2)
+
+# td_receive blocks efficiently inside TDLib, so the waiting loops use a long
+# timeout and only wake when there is actual work (or once a minute to re-arm).
+# The old 1-second re-arm generated a pointless wakeup per second per client.
+_RECEIVE_TIMEOUT = 60.0
+
+# Cap on responses parked for a wait() that has not registered yet. Without
+# it, every timed-out invoke() whose response arrives late - and every send()
+# carrying a {"id": ...} @extra nobody waits on - would leak one event
+# forever. Oldest entries are evicted first; an id parked this long has been
+# abandoned.
+_UNCLAIMED_LIMIT = 256
+
+# Pre-built wire form of the setTdlibParameters request: a single %-format at
+# send time instead of building and dumping a ten-key dict on every auth
+# start. Only used when api_hash matches _API_HASH_RE, so the interpolation
+# cannot produce invalid JSON.
+_API_HASH_RE = re.compile(r"[a-f0-9]{32}\Z")
+_PARAMS_TEMPLATE = (
+    b'{"@type":"setTdlibParameters","database_directory":"tdlib_data",'
+    b'"use_message_database":true,"use_secret_chats":true,'
+    b'"api_id":%d,"api_hash":"%s",'
+    b'"system_language_code":"en","device_model":"Python TDLib Client",'
+    b'"application_version":"1.1"}'
+)
+
 class TdJson:
     """A Python client for the Telegram API using TDLib."""
 
+    __slots__ = (
+        "api_id",
+        "api_hash",
+        "tdjson_path",
+        "tdjson",
+        "client_id",
+        "logger",
+        "log_message_callback_type",
+        "_td_create_client_id",
+        "_td_receive",
+        "_td_send",
+        "_td_execute",
+        "_td_set_log_message_callback",
+        "_log_message_callback",
+        "_ffi",
+        "_ffi_lib",
+        "_get_version_query",
+        "_auth_handlers",
+        "_pending",
+        "_unclaimed",
+        "_pending_lock",
+        "_updates",
+        "_receiver_thread",
+    )
+
     def __init__(self, api_id: int, api_hash: str, tdjson_path: Optional[str] = None):
         """Initialize a Telegram client.
 
@@ -29,9 +111,44 @@ class TdJson:
         self.tdjson_path = tdjson_path
         self._load_library()
         self._setup_functions()
+        self._setup_fast_functions()
         self._setup_logging()
         self.client_id = self._td_create_client_id()
         self.logger = getLogger("simpletd")
+        # Pre-encode parameter-free queries once so the hot paths can skip
+        # serialization entirely.
+        self._get_version_query = _dumps({"@type": "getOption", "name": "version"})
+        if self._ffi is None:
+            # ctypes rebuilds a c_char_p argument for every bytes object it
+            # is handed; wrapping the static payload once skips that per-call
+            # conversion. The cffi path takes bytes as-is.
+            self._get_version_query = c_char_p(self._get_version_query)
+        # One dict lookup per authorization state instead of a chain of
+        # string comparisons. Handlers return True when the flow is done.
+        self._auth_handlers = {
+            "authorizationStateClosed": self._on_closed,
+            "authorizationStateWaitTdlibParameters": self._on_wait_tdlib_parameters,
+            "authorizationStateWaitPhoneNumber": self._on_wait_phone_number,
+            "authorizationStateWaitPremiumPurchase": self._on_wait_premium_purchase,
+            "authorizationStateWaitEmailAddress": self._on_wait_email_address,
+            "authorizationStateWaitEmailCode": self._on_wait_email_code,
+            "authorizationStateWaitCode": self._on_wait_code,
+            "authorizationStateWaitRegistration": self._on_wait_registration,
+            "authorizationStateWaitPassword": self._on_wait_password,
+            "authorizationStateReady": self._on_ready,
+        }
+        # Responses are routed to per-id Futures by a single receiver thread;
+        # everything else lands on the update queue consumed by receive().
+        self._pending: Dict[str, Future] = {}
+        # Responses whose id nobody has registered for yet; wait() checks
+        # here first so send()-then-wait() cannot lose a fast response.
+        self._unclaimed: Dict[str, Dict[str, Any]] = {}
+        self._pending_lock = threading.Lock()
+        self._updates: queue.Queue = queue.Queue()
+        self._receiver_thread = threading.Thread(
+            target=self._recv_loop, name="simpletd-receiver", daemon=True
+        )
+        self._receiver_thread.start()
 
     def _load_library(self) -> None:
         """Load the TDLib shared library."""
@@ -56,6 +173,8 @@ class TdJson:
         except Exception as e:
             sys.exit(f"Error loading TDLib: {e}")
 
+        self.tdjson_path = tdjson_path
+
     def _setup_functions(self) -> None:
         """Set up function signatures for TDLib calls."""
         # Create client ID
@@ -87,6 +206,52 @@ class TdJson:
             self.log_message_callback_type,
         ]
 
+    def _setup_fast_functions(self) -> None:
+        """Rebind the hot FFI calls through cffi when it is available.
+
+        cffi's ABI-mode calls carry far less per-call overhead than ctypes,
+        which adds up in the tight receive loop. ctypes remains the setup
+        and fallback path; set SIMPLETD_USE_CTYPES to skip the rebind.
+        """
+        self._ffi = None
+        self._ffi_lib = None
+        if os.environ.get("SIMPLETD_USE_CTYPES"):
+            return
+        try:
+            import cffi
+        except ImportError:
+            return
+
+        ffi = cffi.FFI()
+        ffi.cdef(
+            """
+            void td_send(int client_id, const char *request);
+            const char *td_receive(double timeout);
+            const char *td_execute(const char *request);
+            """
+        )
+        lib = ffi.dlopen(self.tdjson_path)
+
+        string = ffi.string
+        NULL = ffi.NULL
+        receive = lib.td_receive
+        execute = lib.td_execute
+
+        def _td_receive(timeout: float) -> Optional[bytes]:
+            result = receive(timeout)
+            return string(result) if result != NULL else None
+
+        def _td_execute(query: bytes) -> Optional[bytes]:
+            result = execute(query)
+            return string(result) if result != NULL else None
+
+        self._td_send = lib.td_send
+        self._td_receive = _td_receive
+        self._td_execute = _td_execute
+        # Keep the handles alive for as long as the rebound functions are.
+        self._ffi = ffi
+        self._ffi_lib = lib
+
     def _setup_logging(self, verbosity_level: int = 1) -> None:
         """Configure TDLib logging.
 
@@ -99,6 +264,9 @@ class TdJson:
             if verbosity_level == 0:
                 sys.exit(f"TDLib fatal error: {message.decode('utf-8')}")
 
+        # Hold a reference so the ctypes callback is not garbage collected
+        # while TDLib still points at it.
+        self._log_message_callback = on_log_message_callback
         self._td_set_log_message_callback(2, on_log_message_callback)
         self.execute(
             {"@type": "setLogVerbosityLevel", "new_verbosity_level": verbosity_level}
@@ -113,10 +281,10 @@ class TdJson:
         Returns:
             Response from TDLib or None
         """
-        query_json = json.dumps(query).encode("utf-8")
+        query_json = _dumps(query)
         result = self._td_execute(query_json)
         if result:
-            return json.loads(result.decode("utf-8"))
+            return _loads(result)
         return None
 
     def invoke(self, query: Dict[str, Any], timeout: int | None = None):
@@ -125,15 +293,22 @@ class TdJson:
         Args:
             query: The request to send
         """
-        query["@extra"] = {"id": self.create_extra_id()}
-
-        query_json = json.dumps(query).encode("utf-8")
+        extra_id = self.create_extra_id()
+        query["@extra"] = {"id": extra_id}
+
+        # Serialize first: if the query is unserializable, fail before a
+        # Future is registered rather than leaking one in _pending. The
+        # registration still precedes td_send, so the receiver thread can
+        # never see the response before the Future exists.
+        query_json = _dumps(query)
+        with self._pending_lock:
+            self._pending[extra_id] = Future()
         self._td_send(self.client_id, query_json)
 
-        response = self.wait(query["@extra"]["id"], timeout)
+        response = self.wait(extra_id, timeout)
 
         if response["@type"] == "error":
-            self.logger.error(json.dumps(response))
+            self.logger.error(_dumps(response).decode())
 
         return response
 
@@ -144,26 +319,82 @@ class TdJson:
             query: The request to send
         """
 
-        query_json = json.dumps(query).encode("utf-8")
+        query_json = _dumps(query)
         self._td_send(self.client_id, query_json)
 
+    def _send_raw(self, payload: bytes) -> None:
+        """Send an already-encoded request without re-serializing it.
+
+        Args:
+            payload: The JSON-encoded request bytes
+        """
+        self._td_send(self.client_id, payload)
+
     def receive(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
-        """Receive a response or update from TDLib.
+        """Receive an update from TDLib.
 
         Args:
             timeout: Maximum number of seconds to wait
 
         Returns:
-            An update or response from TDLib, or None if nothing received
+            An update from TDLib, or None if nothing received
         """
-        result = self._td_receive(timeout)
-        if result:
-            return json.loads(result.decode("utf-8"))
-        return None
+        try:
+            return self._updates.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _recv_loop(self) -> None:
+        """Read events from TDLib and dispatch them.
+
+        Runs on the receiver thread as the only caller of td_receive.
+        Responses carrying a registered @extra id complete the matching
+        Future; everything else is forwarded to the update queue.
+        """
+        # Bind everything touched per iteration to locals: LOAD_FAST is
+        # noticeably cheaper than attribute lookups in this loop.
+        td_receive = self._td_receive
+        loads = _loads
+        pending = self._pending
+        unclaimed = self._unclaimed
+        pending_lock = self._pending_lock
+        updates_put = self._updates.put
+        logger = self.logger
+
+        while True:
+            result = td_receive(_RECEIVE_TIMEOUT)
+            if not result:
+                continue
+
+            # Never let one bad event kill the only td_receive caller:
+            # anything unexpected is logged and the loop keeps going.
+            try:
+                event = loads(result)
+                # send() is public, so @extra may be any JSON value; only a
+                # {"id": ...} shape can match a registered Future.
+                extra = event.get("@extra")
+                extra_id = extra.get("id") if isinstance(extra, dict) else None
+
+                if extra_id is not None:
+                    with pending_lock:
+                        future = pending.pop(extra_id, None)
+                        if future is None:
+                            # A wait() for this id may simply not have
+                            # registered yet; park the response so it can
+                            # still be claimed instead of hanging forever.
+                            unclaimed[extra_id] = event
+                            if len(unclaimed) > _UNCLAIMED_LIMIT:
+                                del unclaimed[next(iter(unclaimed))]
+                    if future is not None:
+                        future.set_result(event)
+                else:
+                    updates_put(event)
+            except Exception:
+                logger.exception("Failed to dispatch TDLib event")
 
     def login(self) -> None:
         """Start the authentication process."""
-        self.send({"@type": "getOption", "name": "version"})
+        self._send_raw(self._get_version_query)
 
         print("Starting Telegram authentication flow...")
         print("Press Ctrl+C to cancel at any time.")
@@ -176,123 +407,140 @@ class TdJson:
 
     def _handle_authentication(self) -> None:
         """Handle the TDLib authentication flow."""
+        # Read the update queue directly rather than through receive();
+        # one frame less per event and no None round trip.
+        updates_get = self._updates.get
+        auth_handlers = self._auth_handlers
+        logger = self.logger
         while True:
-            event = self.receive()
-            if not event:
+            try:
+                event = updates_get(timeout=_RECEIVE_TIMEOUT)
+            except queue.Empty:
                 continue
 
-            # Print all updates for debugging
-            event_type = event["@type"]
-            if event_type != "updateAuthorizationState":
-                print(f"Receive: {json.dumps(event, indent=2)}")
+            if event["@type"] != "updateAuthorizationState":
+                # Dump other updates only when someone is actually watching;
+                # re-serializing every event is pure waste otherwise.
+                if logger.isEnabledFor(DEBUG):
+                    logger.debug("Receive: %s", _dumps_pretty(event))
+                continue
+            auth_state = event["authorization_state"]
 
             # Process authorization states
-            if event_type == "updateAuthorizationState":
-                auth_state = event["authorization_state"]
-                auth_type = auth_state["@type"]
-
-                if auth_type == "authorizationStateClosed":
-                    print("Authorization state closed.")
-                    break
-
-                elif auth_type == "authorizationStateWaitTdlibParameters":
-                    if not self.api_id or not self.api_hash:
-                        print(
-                            "\nYou MUST obtain your own api_id and api_hash at https://my.telegram.org"
-                        )
-                        self.api_id = int(input("Please enter your API ID: "))
-                        self.api_hash = input("Please enter your API hash: ")
-
-                    print("Setting TDLib parameters...")
-                    self.send(
-                        {
-                            "@type": "setTdlibParameters",
-                            "database_directory": "tdlib_data",
-                            "use_message_database": True,
-                            "use_secret_chats": True,
-                            "api_id": self.api_id,
-                            "api_hash": self.api_hash,
-                            "system_language_code": "en",
-                            "device_model": "Python TDLib Client",
-                            "application_version": "1.1",
-                        }
-                    )
-
-                elif auth_type == "authorizationStateWaitPhoneNumber":
-                    phone_number = input(
-                        "Please enter your phone number (international format): "
-                    )
-                    self.send(
-                        {
-                            "@type": "setAuthenticationPhoneNumber",
-                            "phone_number": phone_number,
-                        }
-                    )
-
-                elif auth_type == "authorizationStateWaitPremiumPurchase":
-                    print("Telegram Premium subscription is required.")
-                    return
-
-                elif auth_type == "authorizationStateWaitEmailAddress":
-                    email_address = input("Please enter your email address: ")
-                    self.send(
-                        {
-                            "@type": "setAuthenticationEmailAddress",
-                            "email_address": email_address,
-                        }
-                    )
-
-                elif auth_type == "authorizationStateWaitEmailCode":
-                    code = input(
-                        "Please enter the email authentication code you received: "
-                    )
-                    self.send(
-                        {
-                            "@type": "checkAuthenticationEmailCode",
-                            "code": {
-                                "@type": "emailAddressAuthenticationCode",
-                                "code": code,
-                            },
-                        }
-                    )
-
-                elif auth_type == "authorizationStateWaitCode":
-                    code = input("Please enter the authentication code you received: ")
-                    self.send({"@type": "checkAuthenticationCode", "code": code})
-
-                elif auth_type == "authorizationStateWaitRegistration":
-                    first_name = input("Please enter your first name: ")
-                    last_name = input("Please enter your last name: ")
-                    self.send(
-                        {
-                            "@type": "registerUser",
-                            "first_name": first_name,
-                            "last_name": last_name,
-                        }
-                    )
-
-                elif auth_type == "authorizationStateWaitPassword":
-                    password = input("Please enter your password: ")
-                    self.send(
-                        {"@type": "checkAuthenticationPassword", "password": password}
-                    )
-
-                elif auth_type == "authorizationStateReady":
-                    print("Authorization complete! You are now logged in.")
-                    return
+            handler = auth_handlers.get(auth_state["@type"])
+            if handler is not None and handler(auth_state):
+                return
+
+    def _on_closed(self, auth_state: Dict[str, Any]) -> bool:
+        print("Authorization state closed.")
+        return True
+
+    def _on_wait_tdlib_parameters(self, auth_state: Dict[str, Any]) -> bool:
+        if not self.api_id or not self.api_hash:
+            print(
+                "\nYou MUST obtain your own api_id and api_hash at https://my.telegram.org"
+            )
+            self.api_id = int(input("Please enter your API ID: "))
+            self.api_hash = input("Please enter your API hash: ")
+
+        print("Setting TDLib parameters...")
+        if isinstance(self.api_id, int) and _API_HASH_RE.fullmatch(self.api_hash):
+            self._send_raw(_PARAMS_TEMPLATE % (self.api_id, self.api_hash.encode()))
+        else:
+            # Unexpected hash format: let the serializer handle the escaping.
+            self.send(
+                {
+                    "@type": "setTdlibParameters",
+                    "database_directory": "tdlib_data",
+                    "use_message_database": True,
+                    "use_secret_chats": True,
+                    "api_id": self.api_id,
+                    "api_hash": self.api_hash,
+                    "system_language_code": "en",
+                    "device_model": "Python TDLib Client",
+                    "application_version": "1.1",
+                }
+            )
+        return False
+
+    def _on_wait_phone_number(self, auth_state: Dict[str, Any]) -> bool:
+        phone_number = input(
+            "Please enter your phone number (international format): "
+        )
+        self.send(
+            {
+                "@type": "setAuthenticationPhoneNumber",
+                "phone_number": phone_number,
+            }
+        )
+        return False
+
+    def _on_wait_premium_purchase(self, auth_state: Dict[str, Any]) -> bool:
+        print("Telegram Premium subscription is required.")
+        return True
+
+    def _on_wait_email_address(self, auth_state: Dict[str, Any]) -> bool:
+        email_address = input("Please enter your email address: ")
+        self.send(
+            {
+                "@type": "setAuthenticationEmailAddress",
+                "email_address": email_address,
+            }
+        )
+        return False
+
+    def _on_wait_email_code(self, auth_state: Dict[str, Any]) -> bool:
+        code = input("Please enter the email authentication code you received: ")
+        self.send(
+            {
+                "@type": "checkAuthenticationEmailCode",
+                "code": {
+                    "@type": "emailAddressAuthenticationCode",
+                    "code": code,
+                },
+            }
+        )
+        return False
+
+    def _on_wait_code(self, auth_state: Dict[str, Any]) -> bool:
+        code = input("Please enter the authentication code you received: ")
+        self.send({"@type": "checkAuthenticationCode", "code": code})
+        return False
+
+    def _on_wait_registration(self, auth_state: Dict[str, Any]) -> bool:
+        first_name = input("Please enter your first name: ")
+        last_name = input("Please enter your last name: ")
+        self.send(
+            {
+                "@type": "registerUser",
+                "first_name": first_name,
+                "last_name": last_name,
+            }
+        )
+        return False
 
-    def wait(self, extra: str, timeout: int | None = None):
-        "Wait for update with specified id"
-        start_time = time.time()
-        while True:
-            if not (timeout is None) and  timeout > 0:
-                if time.time() - start_time:
-                    raise TimeoutError
+    def _on_wait_password(self, auth_state: Dict[str, Any]) -> bool:
+        password = input("Please enter your password: ")
+        self.send({"@type": "checkAuthenticationPassword", "password": password})
+        return False
 
-            event = self.receive()
+    def _on_ready(self, auth_state: Dict[str, Any]) -> bool:
+        print("Authorization complete! You are now logged in.")
+        return True
 
-            if event and event.get("@extra") and event["@extra"]["id"] == extra:
+    def wait(self, extra: str, timeout: int | None = None):
+        "Wait for the response with the specified @extra id"
+        with self._pending_lock:
+            event = self._unclaimed.pop(extra, None)
+            if event is not None:
                 return event
+            future = self._pending.setdefault(extra, Future())
+        try:
+            return future.result(timeout)
+        except _FutureTimeoutError:
+            with self._pending_lock:
+                self._pending.pop(extra, None)
+            raise TimeoutError
 
     def create_extra_id(self, bytes_size: int = 9):
-        return binascii.hexlify(os.urandom(bytes_size)).decode()
+        return os.urandom(bytes_size).hex()